@@ -1,9 +1,68 @@
 import argparse
+import asyncio
+import os
+import time
+import orjson
 import yaml
 import ccxt
-import time
+import ccxt.pro
+
+# 市场快照磁盘缓存有效期（秒），市场精度/手续费信息变化很少，不必每次启动都拉取
+MARKETS_CACHE_TTL = 24 * 3600
 
-def execute_arbitrage(symbol: str, a_exchange: ccxt.Exchange, b_exchange: ccxt.Exchange, base_amount: float, quote_amount: float = None):
+def get_markets_cached(exchange):
+    """尝试从磁盘快照填充 exchange.markets，命中返回True，省去一次 loadMarkets REST 往返"""
+    cache_file = f"markets_{exchange.id}.json"
+    try:
+        if time.time() - os.path.getmtime(cache_file) < MARKETS_CACHE_TTL:
+            with open(cache_file, 'rb') as f:
+                exchange.set_markets(orjson.loads(f.read()))
+            return True
+    except (OSError, ValueError):
+        pass
+    return False
+
+async def ensure_markets(exchange):
+    """确保市场数据已加载：缓存未命中时拉取一次并写回磁盘供下次启动复用"""
+    if exchange.markets:
+        return
+    markets = await exchange.load_markets()
+    try:
+        with open(f"markets_{exchange.id}.json", 'wb') as f:
+            f.write(orjson.dumps(markets))
+    except OSError as e:
+        print(f"市场快照写入失败 [{exchange.id}]: {str(e)}")
+
+def calculate_profit(buy_price, buy_filled, buy_fee, sell_price, sell_filled, sell_fee):
+    """利润 = 卖出净所得 - 买入总成本（手续费分别计入两边）
+
+    只用四则运算实现，入参既可以是单笔成交的标量，也可以是整批历史机会的
+    NumPy 数组——回测时一次调用即可对全量机会做逐元素计算，无需逐笔循环
+    """
+    return (sell_price * sell_filled - sell_fee) - (buy_price * buy_filled + buy_fee)
+
+async def wait_order_closed(exchange, order, symbol, poll_timeout=5.0):
+    """通过交易所用户数据 WebSocket 等待订单完全成交，返回最终订单信息"""
+    # 市价单可能下单即成交，先检查一次避免白等推送
+    if order['status'] == 'closed':
+        return order
+
+    while True:
+        # 订阅是下单之后才建立的，之前发生的成交不会再推送过来；部分交易所
+        # （OKX/Bitget）下单响应里 status 为 None，纯等推送可能带着持仓永远
+        # 等下去。超时没等到就主动 fetch_order 兜底一次
+        try:
+            orders = await asyncio.wait_for(exchange.watch_orders(symbol), timeout=poll_timeout)
+        except asyncio.TimeoutError:
+            order = await exchange.fetch_order(order['id'], symbol)
+            if order['status'] == 'closed':
+                return order
+            continue
+        for o in orders:
+            if o['id'] == order['id'] and o['status'] == 'closed':
+                return o
+
+async def execute_arbitrage(symbol: str, a_exchange: ccxt.Exchange, b_exchange: ccxt.Exchange, base_amount: float, quote_amount: float = None):
     """执行跨交易所市价单套利交易。amount：为买入数量币的数量，不是USDT数量"""
     try:
         # 强制使用市价单交易， 市价单比限价单手续费要多。这里可以进行调参优化 限价单优惠买卖加低的手续费可能利润更高。可以自行调参测试
@@ -21,20 +80,28 @@ def execute_arbitrage(symbol: str, a_exchange: ccxt.Exchange, b_exchange: ccxt.E
         if quote_amount == None:
             quote_amount = base_amount
 
-        buy_order = a_exchange.create_market_buy_order(symbol, buy_amount, a_params)
-        sell_order = b_exchange.create_market_sell_order(symbol, base_amount, b_params)
-
-        print("交易开始...")
-        while True:
-            buy_order = a_exchange.fetch_order(buy_order['id'], symbol)
-            sell_order = b_exchange.fetch_order(sell_order['id'], symbol)
+        # 两腿并发发出，执行窗口从 RTT(买)+RTT(卖) 缩短到 max(RTT(买), RTT(卖))，
+        # 挂单期间暴露在行情变动下的时间减半
+        buy_order, sell_order = await asyncio.gather(
+            a_exchange.create_market_buy_order(symbol, buy_amount, a_params),
+            b_exchange.create_market_sell_order(symbol, base_amount, b_params),
+            return_exceptions=True,
+        )
 
-            if buy_order['status'] == 'closed' and sell_order['status'] == 'closed':
-                break
-            time.sleep(1)
+        # 单腿失败意味着裸头寸，必须把已提交的另一腿指出来，便于手动对冲
+        if isinstance(buy_order, Exception) and isinstance(sell_order, Exception):
+            raise ValueError(f"双腿下单均失败: 买 {str(buy_order)} / 卖 {str(sell_order)}")
+        if isinstance(buy_order, Exception):
+            raise ValueError(f"买腿下单失败，卖腿订单 {sell_order['id']} 已提交，存在裸头寸: {str(buy_order)}")
+        if isinstance(sell_order, Exception):
+            raise ValueError(f"卖腿下单失败，买腿订单 {buy_order['id']} 已提交，存在裸头寸: {str(sell_order)}")
 
-            # 打印交易的进度
-            print(f"交易进度: 买入 {buy_order['status']}，卖出 {sell_order['status']}")
+        print("交易开始...")
+        # WebSocket 推送等待成交，替代每秒轮询 fetch_order，成交确认延迟从秒级降到毫秒级
+        buy_order, sell_order = await asyncio.gather(
+            wait_order_closed(a_exchange, buy_order, symbol),
+            wait_order_closed(b_exchange, sell_order, symbol),
+        )
 
         # 免手续费fee情况的处理
         buy_fee = 0.0
@@ -50,14 +117,16 @@ def execute_arbitrage(symbol: str, a_exchange: ccxt.Exchange, b_exchange: ccxt.E
             sell_fee = sum(fee['cost'] for fee in sell_order['fees'])
 
 
+        # 订单字段绑定成局部变量，省去后面反复的dict取值
         buy_price = buy_order['average']
+        buy_filled = float(buy_order['amount'])
         sell_price = sell_order['average']
+        sell_filled = float(sell_order['amount'])
 
         print(buy_order)
         print(sell_order)
-        
-        # 计算利润 从 buy_order 和 sell_order
-        profit = buy_price * buy_order['amount'] + buy_fee - (sell_price * sell_order['amount'] - sell_fee)
+
+        profit = calculate_profit(buy_price, buy_filled, buy_fee, sell_price, sell_filled, sell_fee)
 
         return {
             'buy_price': buy_price,
@@ -66,7 +135,7 @@ def execute_arbitrage(symbol: str, a_exchange: ccxt.Exchange, b_exchange: ccxt.E
             'profitable': profit > 0,
             'buy_fee': buy_fee,
             'sell_fee': sell_fee,
-            'coin': float(buy_order['amount']) - float(sell_order['amount']),
+            'coin': buy_filled - sell_filled,
         }
     except ccxt.InsufficientFunds as e:
         raise ValueError(f"资金不足: {str(e)}")
@@ -77,24 +146,38 @@ def execute_arbitrage(symbol: str, a_exchange: ccxt.Exchange, b_exchange: ccxt.E
     except Exception as e:
         raise ValueError(f"交易执行失败: {str(e)}")
 
+# 进程内交易所实例注册表：行情 watch、余额查询、下单、订单推送全部复用同一个
+# ccxt.pro 实例，每个交易所只有一份 aiohttp 会话、一条认证 WS 连接和一份市场数据
+_exchange_registry = {}
+
 def load_exchange(config, exchange_name):
-    """从配置加载交易所实例"""
+    """从配置加载交易所实例（按 交易所+API key 在进程内复用同一实例）"""
     try:
-        exchange_class = getattr(ccxt, exchange_name)
+        api_key = config['exchanges'][exchange_name]['api_key']
+        registry_key = (exchange_name, api_key)
+        if registry_key in _exchange_registry:
+            return _exchange_registry[registry_key]
+
+        # ccxt.pro 实例同时支持 REST 和 WebSocket（watch_orders 等），REST 接口全部为协程
+        exchange_class = getattr(ccxt.pro, exchange_name)
         exchange_params = {
-            'apiKey': config['exchanges'][exchange_name]['api_key'],
+            'apiKey': api_key,
             'secret': config['exchanges'][exchange_name]['api_secret'],
             'enableRateLimit': True
         }
         
         if 'password' in config['exchanges'][exchange_name]:
             exchange_params['password'] = config['exchanges'][exchange_name]['password']
-        
-        return exchange_class(exchange_params)
+
+        exchange = exchange_class(exchange_params)
+        # 命中磁盘快照则直接填充市场数据，避免 fetch_balance 等接口内部隐式触发 loadMarkets
+        get_markets_cached(exchange)
+        _exchange_registry[registry_key] = exchange
+        return exchange
     except (KeyError, AttributeError) as e:
         raise ValueError(f"交易所配置错误: {str(e)}")
 
-def main():
+async def main():
     parser = argparse.ArgumentParser(description='跨交易所市价套利工具')
     parser.add_argument('--symbol', required=True, help='交易对，例如 BTC/USDT')
     parser.add_argument('--buy', required=True, dest='buy_exchange', help='买入交易所名称')
@@ -120,15 +203,19 @@ def main():
 
     # 执行套利交易的代码部分
     try:
-        result = execute_arbitrage(
+        await asyncio.gather(ensure_markets(buy_ex), ensure_markets(sell_ex))
+        result = await execute_arbitrage(
             symbol=args.symbol,
             a_exchange=buy_ex,
             b_exchange=sell_ex,
-            amount=args.amount,
+            base_amount=args.amount,
         )
     except Exception as e:
         print(f"执行错误: {str(e)}")
         return
+    finally:
+        await buy_ex.close()
+        await sell_ex.close()
 
     # 格式化输出
     print(f"\n套利交易结果 ({args.symbol})")
@@ -136,12 +223,13 @@ def main():
     print(f"[买入] {args.buy_exchange.ljust(10)} 均价: {result['buy_price']:.8f}")
     print(f"[卖出] {args.sell_exchange.ljust(10)} 均价: {result['sell_price']:.8f}")
     print("-"*40)
-    print(f"实际买入数量: {result['base_acquired']:.8f}")
-    print(f"最终获得金额: {result['final_quote']:.2f}")
-    print(f"投入金额: {args.amount:.2f}")
+    print(f"买入手续费: {result['buy_fee']:.8f}")
+    print(f"卖出手续费: {result['sell_fee']:.8f}")
+    print(f"两腿币量差额: {result['coin']:.8f}")
+    print(f"投入数量: {args.amount:.8f}")
     print("="*40)
     status = "成功盈利" if result['profitable'] else "亏损"
     print(f"实际利润: {result['profit']:.2f} ({status})")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
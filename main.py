@@ -1,53 +1,148 @@
 import asyncio
+import logging
+import math
+import queue
+import time
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 import argparse
-import requests
+import aiohttp
+import numpy as np
+import orjson
 import yaml
-import ccxt
-from collections import defaultdict
 from wsmonitor import SinglePairMonitor
-from autotrade import execute_arbitrage, load_exchange
+from autotrade import execute_arbitrage, load_exchange, ensure_markets
+
+try:
+    # libuv 事件循环的调度开销比默认 selector 循环低数倍，装了就用
+    import uvloop
+except ImportError:
+    uvloop = None
+
+logger = logging.getLogger(__name__)
+
+class DropOnFullQueueHandler(QueueHandler):
+    """队列满时直接丢弃日志，绝不阻塞：慢速终端/管道不能反压行情处理"""
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+def setup_logging(debug=False):
+    """热路径日志只入队即返回，真正的 stdout 写入由后台监听线程完成"""
+    log_queue = queue.Queue(maxsize=10000)
+    listener = QueueListener(log_queue, logging.StreamHandler())
+    root = logging.getLogger()
+    root.addHandler(DropOnFullQueueHandler(log_queue))
+    root.setLevel(logging.DEBUG if debug else logging.INFO)
+    listener.start()
+    return listener
 
 class MultiExchangeArbitrageBot(SinglePairMonitor):
+    # 消息模板在类加载时固定，发送时一次 format 出整串，
+    # 不再每次构建 N 个 f-string 的列表再 join
+    STARTUP_TMPL = (
+        "🚀 套利机器人启动\n"
+        "交易对: {symbol}\n"
+        "交易所: {exchanges}\n"
+        "模式: {mode}\n"
+        "单次限额: {limit} {base_ccy}\n"
+        "最大交易次数: {max_trades}\n"
+        "启动时间: {start_time}\n"
+        "利差阈值: {threshold:.2f}%"
+    )
+    ALERT_TMPL = (
+        "✅ {mode}套利信号\n"
+        "交易对: {symbol}\n"
+        "买入: {buy_ex} ({buy_price:.4f})\n"
+        "卖出: {sell_ex} ({sell_price:.4f})\n"
+        "价差: {spread:.2f}%\n"
+        "利润: {profit:.4f} {quote_ccy}\n"
+        "手续费：{fee_detail}\n"
+        "剩余次数: {remaining}"
+    )
+    SUMMARY_TMPL = (
+        "\n" + "=" * 40 + "\n"
+        "{title}\n"
+        "模式: {mode}\n"
+        "交易对: {symbol}\n"
+        "交易所: {exchanges}\n"
+        "利差百分比阈值: {threshold}%\n"
+        "运行时长: {duration}\n"
+        "总交易次数: {trade_count}\n"
+        "总利润: {total_profit:.4f}\n"
+        + "=" * 40
+    )
+
     def __init__(self, config, symbol, exchanges, threshold, webhook_url, limit=1, max_trades=1, dry_run=True):
         super().__init__(symbol, exchanges, threshold, webhook_url)
         self.dry_run = dry_run
+        # 交易对拆分结果和 webhook 载荷模板都是不变量，构造时算好，热路径不再重复分配
+        self.base_ccy, self.quote_ccy = symbol.split('/')
+        self._wh_payload = {"msgtype": "text", "text": {"content": None}}
         self.start_time = datetime.now()
-        self.price_records = defaultdict(lambda: None)
-        self.balances = defaultdict(lambda: {'base': 0.0, 'quote': 0.0})
+        # 价格存成按交易所下标索引的连续 float64 数组，NaN为哨兵：
+        # 每tick更新只写一个槽位；检测是对整个数组的向量化归约，
+        # 以后扩展成 多交易对×多交易所 只需把形状改成 (S, E) 按轴归约
+        self._ex_index = {ex: i for i, ex in enumerate(exchanges)}
+        self._ex_upper = [ex.upper() for ex in exchanges]  # 状态输出用，免得每tick重算
+        self.price_records = np.full(len(exchanges), np.nan, dtype=np.float64)
+        # 键集合构造时已知且固定，预分配替代 defaultdict：
+        # 访问缺键不再触发 lambda 工厂，也杜绝键打错悄悄生成幽灵条目
+        self.balances = {ex: {'base': 0.0, 'quote': 0.0} for ex in exchanges}
         self.trade_count = 0
         self.total_profit = 0
         self.called = False
         self.trade_lock = asyncio.Lock()
         self.base_amount_max_limit = limit
         self.max_trades = max_trades
+        self._thr_ratio = threshold / 100.0  # 预除好的阈值比例，热路径上免去除法
+        self._http_session = None  # 首次发送时在事件循环内创建，之后复用长连接
+        self._webhook_tasks = set()  # 在途的 webhook 任务，退出前统一等它们发完
+        # 账户 WS 推送余额变动时按交易所分别触发：交易后要等买卖两腿各自
+        # 的推送都到齐，共用一个事件会被先到的一腿（甚至无关交易所）放行
+        self._balance_events = {ex: asyncio.Event() for ex in exchanges}
+        self._last_status_log = 0.0  # 上次输出状态的 monotonic 时刻，用于限频
+        self._ws_tasks = []  # main() 里创建的行情/余额/保活任务，停机时只取消这些
+
+        # 两所套利是最常见的部署形态，构造时直接绑定特化实现：
+        # 一次大小比较替代通用的向量化归约
+        if len(exchanges) == 2:
+            self.find_best_opportunity = self._find_best_2ex
 
         self.exchange_instances = {
             ex: load_exchange(config, ex) for ex in self.exchanges
         }
         
-        startup_msg = [
-            f"🚀 套利机器人启动",
-            f"交易对: {symbol}",
-            f"交易所: {', '.join(exchanges)}",
-            f"模式: {'模拟交易' if dry_run else '真实交易'}",
-            f"单次限额: {limit} {symbol.split('/')[0]}",
-            f"最大交易次数: {max_trades}",
-            f"启动时间: {self.start_time.strftime('%Y-%m-%d %H:%M:%S')}",
-            f"利差阈值: {threshold:.2f}%"
-        ]
-        self.send_webhook("\n".join(startup_msg))
+        self.send_webhook(self.STARTUP_TMPL.format(
+            symbol=symbol,
+            exchanges=', '.join(exchanges),
+            mode='模拟交易' if dry_run else '真实交易',
+            limit=limit,
+            base_ccy=self.base_ccy,
+            max_trades=max_trades,
+            start_time=self.start_time.strftime('%Y-%m-%d %H:%M:%S'),
+            threshold=threshold,
+        ))
 
     async def show_initial_balances(self):
         """余额检查失败直接退出"""
-        base_currency, quote_currency = self.symbol.split('/')
+        base_currency, quote_currency = self.base_ccy, self.quote_ccy
         balance_msg = ["💵 初始余额检查:"]
-        
-        for exchange in self.exchanges:
+
+        # 每个交易所一次 fetch_balance 拿全币种快照，N 个交易所并发只等一批；
+        # 这是唯一一次 REST 余额查询，之后余额由账户 WebSocket 推送维护
+        tasks = [self._fetch_balance_snapshot(ex) for ex in self.exchanges]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        for exchange, balance in zip(self.exchanges, results):
             try:
-                base_balance = await self.check_balance(exchange, base_currency)
-                quote_balance = await self.check_balance(exchange, quote_currency)
+                if isinstance(balance, Exception):
+                    raise balance
 
+                base_balance = balance.get(base_currency, {}).get('free', 0.0)
+                quote_balance = balance.get(quote_currency, {}).get('free', 0.0)
                 if base_balance is None or quote_balance is None:
                     raise ValueError(f"{exchange} 余额数据异常")
 
@@ -66,66 +161,118 @@ class MultiExchangeArbitrageBot(SinglePairMonitor):
                     raise RuntimeError(error_msg)
         
         full_msg = "\n".join(balance_msg)
-        print(full_msg)
+        logger.info(full_msg)
         self.send_webhook(full_msg)
 
-    async def check_balance(self, exchange_name, currency):
-        try:
-            exchange = self.exchange_instances[exchange_name]
-            balance = await asyncio.to_thread(
-                exchange.fetch_balance, {'type': 'spot'}
-            )
-            return balance.get(currency, {}).get('free', 0.0)
-        except Exception as e:
-            print(f"余额查询失败 [{exchange_name}]: {str(e)}")
-            return None
-        
+    async def _fetch_balance_snapshot(self, exchange_name):
+        """启动时的一次性 REST 余额快照；实例是 ccxt.pro 的，直接 await，无线程池跳转"""
+        exchange = self.exchange_instances[exchange_name]
+        return await exchange.fetch_balance({'type': 'spot'})
+
+    async def watch_balances(self, exchange_name):
+        """订阅账户余额 WebSocket 推送，把 self.balances 维持在内存里，读取变成 O(1)"""
+        exchange = self.exchange_instances[exchange_name]
+        while self.is_running:
+            try:
+                balance = await exchange.watch_balance()
+                record = self.balances[exchange_name]
+                if self.base_ccy in balance:
+                    record['base'] = balance[self.base_ccy].get('free', record['base'])
+                if self.quote_ccy in balance:
+                    record['quote'] = balance[self.quote_ccy].get('free', record['quote'])
+                self._balance_events[exchange_name].set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"{exchange_name} 余额流异常: {str(e)}，5秒后重试...")
+                await asyncio.sleep(5)
 
     async def find_best_opportunity(self):
         """寻找最佳套利机会（带有效性验证）"""
-        valid_prices = {k:v for k,v in self.price_records.items() if v is not None}
-        if len(valid_prices) < 2:
-            return None, None
-
-        # 寻找最低买入价和最高卖出价
-        buy_ex = min(valid_prices, key=valid_prices.get)
-        sell_ex = max(valid_prices, key=valid_prices.get)
-        min_price = valid_prices[buy_ex]
-        max_price = valid_prices[sell_ex]
-        
-        # 计算价差百分比
-        spread = ((max_price - min_price) / min_price) * 100
-
-        # 打印实时状态
-        status = [
-            f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] {self.symbol}",
-            *[f"{ex.upper()}: {price:.4f}" for ex, price in valid_prices.items()],
-            f"价差百分比: {spread:.4f}%"
-        ]
-        print("\n".join(status) + "\n" + "-"*40)
-        
-        if spread >= self.threshold:
-            return buy_ex, sell_ex, spread
-        return None, None, None
+        # NaN 槽位（还没收到行情的交易所）由 nanargmin/nanargmax 自动忽略，
+        # 归约在连续数组上以 C 速度完成，不经过 Python 逐元素循环
+        prices = self.price_records
+        if len(prices) - int(np.isnan(prices).sum()) < 2:
+            return None
+
+        buy_idx = int(np.nanargmin(prices))
+        sell_idx = int(np.nanargmax(prices))
+        min_price = float(prices[buy_idx])
+        max_price = float(prices[sell_idx])
+        buy_ex = self.exchanges[buy_idx]
+        sell_ex = self.exchanges[sell_idx]
+
+        # max-min >= thr_ratio*min 与 (max-min)/min*100 >= threshold 等价，
+        # 每tick省掉一次浮点除法，价差百分比只在命中或DEBUG时才真正计算
+        hit = (max_price - min_price) >= self._thr_ratio * min_price
+
+        # 状态输出在每个tick都格式化N个浮点数，开销可观：只在DEBUG级别、
+        # 且价差逼近阈值（八成以上）或距上次输出超过1秒（心跳）时才构建，
+        # 平静行情里绝大多数tick在两次浮点比较后就返回
+        if logger.isEnabledFor(logging.DEBUG):
+            now_mono = time.monotonic()
+            near = (max_price - min_price) >= 0.8 * self._thr_ratio * min_price
+            if near or now_mono - self._last_status_log >= 1.0:
+                self._last_status_log = now_mono
+                # time 模块拼时间戳比 datetime.now().strftime 便宜得多（无对象分配）
+                now_ms = time.time_ns() // 1_000_000
+                status = [
+                    f"[{time.strftime('%H:%M:%S', time.localtime(now_ms // 1000))}.{now_ms % 1000:03d}] {self.symbol}",
+                    *[f"{ex}: {price:.4f}" for ex, price in zip(self._ex_upper, self.price_records) if not math.isnan(price)],
+                    f"价差百分比: {((max_price - min_price) / min_price) * 100:.4f}%"
+                ]
+                logger.debug("\n".join(status) + "\n" + "-"*40)
+
+        if hit:
+            spread = ((max_price - min_price) / min_price) * 100
+            return buy_ex, sell_ex, min_price, max_price, spread
+        return None
+
+    async def _find_best_2ex(self):
+        """len(exchanges)==2 的特化路径：一次比较即可出结果，免去数组归约"""
+        p0 = float(self.price_records[0])
+        p1 = float(self.price_records[1])
+        if math.isnan(p0) or math.isnan(p1):
+            return None
+
+        if p0 < p1:
+            buy_idx, sell_idx, min_price, max_price = 0, 1, p0, p1
+        else:
+            buy_idx, sell_idx, min_price, max_price = 1, 0, p1, p0
 
+        if logger.isEnabledFor(logging.DEBUG):
+            now_mono = time.monotonic()
+            if ((max_price - min_price) >= 0.8 * self._thr_ratio * min_price
+                    or now_mono - self._last_status_log >= 1.0):
+                self._last_status_log = now_mono
+                logger.debug(
+                    f"{self.symbol} {self._ex_upper[0]}: {p0:.4f} {self._ex_upper[1]}: {p1:.4f} "
+                    f"价差百分比: {((max_price - min_price) / min_price) * 100:.4f}%"
+                )
+
+        if (max_price - min_price) >= self._thr_ratio * min_price:
+            spread = ((max_price - min_price) / min_price) * 100
+            return self.exchanges[buy_idx], self.exchanges[sell_idx], min_price, max_price, spread
+        return None
 
-    async def safe_execute_arbitrage(self, buy_ex, sell_ex):
+
+    async def safe_execute_arbitrage(self, buy_ex, sell_ex, buy_price, sell_price):
+        """价格由检测时刻的快照传入：检测到执行之间新tick可能已覆盖槽位，
+        重新读取会把交易量和利润算在过期报价上"""
         if not self.is_running:
             return None
 
         if self.dry_run:
             await asyncio.sleep(5) # 等5秒，模拟滑点
-            async with self.lock:
-                return {
-                    'buy_price': self.price_records[buy_ex],
-                    'sell_price': self.price_records[sell_ex],
-                    'profit': (self.price_records[sell_ex] - self.price_records[buy_ex]) * 1, # 模拟一个基础货币
-                    'symbol': self.symbol
-                }
+            return {
+                'buy_price': buy_price,
+                'sell_price': sell_price,
+                'profit': (sell_price - buy_price) * 1, # 模拟一个基础货币
+                'symbol': self.symbol
+            }
         else:
             try:
                 # 计算实际可交易量
-                buy_price = self.price_records[buy_ex]
                 max_buy = self.balances[buy_ex]['quote'] / buy_price
                 max_sell = self.balances[sell_ex]['base']
                 
@@ -135,85 +282,175 @@ class MultiExchangeArbitrageBot(SinglePairMonitor):
                     self.base_amount_max_limit
                 )
 
+                # 计算过程保持 float，只在下单边界用市场精度规则截断，避免交易所因精度拒单
+                trade_amount = float(
+                    self.exchange_instances[buy_ex].amount_to_precision(self.symbol, trade_amount)
+                )
+
                 # 提示即将进行的交易信息
                 self.send_webhook("\n".join([
                      f"即将进行的交易信息",
                      f"交易对: {self.symbol}",
                      f"买卖交易所: {buy_ex} -> {sell_ex}",
-                     f"买入价：{self.price_records[buy_ex]:.4f}",
-                     f"卖出价：{self.price_records[sell_ex]:.4f}",
-                     f"{self.symbol.split("/")[0]}交易量：{trade_amount:.4f}",
-                     f"{self.symbol.split("/")[0]}可用余额：(买{max_buy:.4f},卖{max_sell:.4f},限{self.base_amount_max_limit:.4f})",
+                     f"买入价：{buy_price:.4f}",
+                     f"卖出价：{sell_price:.4f}",
+                     f"{self.base_ccy}交易量：{trade_amount:.4f}",
+                     f"{self.base_ccy}可用余额：(买{max_buy:.4f},卖{max_sell:.4f},限{self.base_amount_max_limit:.4f})",
                 ]))
 
-                result = execute_arbitrage(
+                # 成交后的余额变动由账户 WebSocket 推送回来，不再整套 REST 重查。
+                # 事件要在下单前清掉：成交触发的推送多半在等待成交期间就已到达，
+                # 下单后再 clear 会把它丢掉，然后白等一轮超时
+                self._balance_events[buy_ex].clear()
+                self._balance_events[sell_ex].clear()
+
+                result = await execute_arbitrage(
                     self.symbol,
                     self.exchange_instances[buy_ex],
                     self.exchange_instances[sell_ex],
                     trade_amount,
-                    self.price_records[buy_ex] * trade_amount if buy_ex == 'bitget' else None, # bitget只能以U计价买入
+                    buy_price * trade_amount if buy_ex == 'bitget' else None, # bitget只能以U计价买入
                 )
 
-                # 完成后显示并更新余额
-                await self.show_initial_balances()
+                try:
+                    # 买卖两腿的余额推送都到齐才算同步完成：只等到一腿就继续，
+                    # 另一腿的过期高余额会把下一笔卖单量算大，实盘直接资金不足
+                    await asyncio.wait_for(
+                        asyncio.gather(
+                            self._balance_events[buy_ex].wait(),
+                            self._balance_events[sell_ex].wait(),
+                        ),
+                        timeout=10,
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning("等待余额推送超时，沿用内存中的余额")
 
                 return result
             except Exception as e:
-                self.send_webhook(f"‼️ 交易执行异常: {str(e)}")
+                # 致命告警同步发出：exit 抛出 SystemExit 后后台任务不会再被调度
+                await self._post_webhook(f"‼️ 交易执行异常: {str(e)}")
                 exit(2)
 
+    async def keep_connections_warm(self, interval=30):
+        """周期性发最轻量的请求，让各交易所的 TCP/TLS 长连接保持热态：
+        机会出现时下单走的是现成连接，不用临时重付握手延迟"""
+        while self.is_running:
+            for ex_name in self.exchanges:
+                try:
+                    await self.exchange_instances[ex_name].fetch_time()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"{ex_name} 连接保活失败: {str(e)}")
+            await asyncio.sleep(interval)
+
+    async def watch_prices(self, exchange_name):
+        """用 ccxt.pro 的成交推送流喂价格，内置断线重连，复用下单用的同一批实例"""
+        exchange = self.exchange_instances[exchange_name]
+        while self.is_running:
+            try:
+                trades = await exchange.watch_trades(self.symbol)
+                if trades:
+                    await self.handle_price_update(exchange_name, trades[-1]['price'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"{exchange_name} 行情流异常: {str(e)}，5秒后重试...")
+                await asyncio.sleep(5)
+
+    def _on_webhook_done(self, task):
+        self._webhook_tasks.discard(task)
+        # _post_webhook 内部已兜底常规异常，这里只兜任务层面的意外，避免静默吞掉
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Webhook 任务异常: {task.exception()}")
+
     def send_webhook(self, message):
-        """增强的 webhook 发送方法"""
+        """增强的 webhook 发送方法：投递为后台任务，不阻塞价格处理协程"""
         try:
-            requests.post(
+            task = asyncio.get_running_loop().create_task(self._post_webhook(message))
+            self._webhook_tasks.add(task)
+            task.add_done_callback(self._on_webhook_done)
+        except RuntimeError:
+            # 事件循环尚未运行（只可能出现在构造阶段异常路径），丢弃消息但不中断主流程
+            print(f"Webhook 发送失败: 事件循环未运行\n{message}")
+
+    async def _post_webhook(self, message):
+        try:
+            if self._http_session is None or self._http_session.closed:
+                self._http_session = aiohttp.ClientSession(
+                    timeout=aiohttp.ClientTimeout(total=3),
+                    # 长连接保活 60s：告警往往成串出现，后续发送免去 TCP/TLS 握手
+                    connector=aiohttp.TCPConnector(keepalive_timeout=60, limit=10),
+                )
+            # 单线程事件循环内复用同一载荷模板是安全的，省掉每次发送的两层dict分配
+            # data= 传 orjson 序列化结果，绕过 aiohttp 内部的 stdlib json 编码
+            self._wh_payload["text"]["content"] = message
+            # 读完响应体连接才会归还 keep-alive 池，否则 aiohttp 直接关闭连接
+            async with self._http_session.post(
                 self.webhook_url,
-                json={"msgtype": "text", "text": {"content": message}},
-                timeout=3
-            )
+                data=orjson.dumps(self._wh_payload),
+                headers={'Content-Type': 'application/json'},
+            ) as resp:
+                await resp.read()
         except Exception as e:
-            print(f"Webhook 发送失败: {str(e)}")
+            logger.error(f"Webhook 发送失败: {str(e)}")
 
     async def handle_price_update(self, exchange, price):
         if not self.is_running:
             return
 
-        async with self.lock:
-            self.price_records[exchange] = float(price)
-            opportunity = await self.find_best_opportunity()
-            if not opportunity:
-                return
-            buy_ex, sell_ex, spread = opportunity
+        # 每个交易所的行情流是独立协程、各写各的槽位，事件循环内单槽写入本身原子，
+        # 不需要锁；机会检测读到的即便是并发更新中的快照也只是更旧一个tick的价格
+        self.price_records[self._ex_index[exchange]] = float(price)
+
+        # 交易进行中就不必评估机会了，交易结束后由下一个tick触发
+        if self.trade_lock.locked():
+            return
+
+        opportunity = await self.find_best_opportunity()
+        if opportunity is None:
+            return
+        buy_ex, sell_ex, buy_price, sell_price, spread = opportunity
 
         try:
-            if buy_ex == None or sell_ex == None or buy_ex == sell_ex:
+            if buy_ex == sell_ex:
                 return
             
             if self.trade_lock.locked():
-                print(f"⏳ 交易进行中: {buy_ex}→{sell_ex}")
+                logger.info(f"⏳ 交易进行中: {buy_ex}→{sell_ex}")
                 return
 
+            # 临界区只包住真正的下单和计数，通知构建/发送放到释放锁之后，
+            # 缩短后续tick被挡在 trade_lock 外的窗口
             async with self.trade_lock:
-                result = await self.safe_execute_arbitrage(buy_ex, sell_ex)
+                result = await self.safe_execute_arbitrage(buy_ex, sell_ex, buy_price, sell_price)
                 if result:
                     self.total_profit += result['profit']
                     if not self.dry_run:
                         self.trade_count += 1
 
-                    alert_msg = [
-                        f"✅ {'[模拟] ' if self.dry_run else ''}套利信号",
-                        f"交易对: {self.symbol}",
-                        f"买入: {buy_ex} ({result['buy_price']:.4f})",
-                        f"卖出: {sell_ex} ({result['sell_price']:.4f})",
-                        f"价差: {((result['sell_price']-result['buy_price']) / result['buy_price'] * 100.0):.2f}%",
-                        f"利润: {result['profit']:.4f} {self.symbol.split('/')[1]}",
-                        # 如果是实盘输出手续费
-                        f"手续费：{0 if self.dry_run else f'{result['buy_fee']}+{result['sell_fee']}={(result['buy_fee']+result['sell_fee']):.4f}'}",
-                        f"剩余次数: {self.max_trades - self.trade_count}"
-                    ]
-                    self.send_webhook("\n".join(alert_msg))
-
-                    if self.trade_count >= self.max_trades:
-                        await self.stop("🎯 已达最大交易次数")
+            if result:
+                # 如果是实盘输出手续费
+                fee_detail = (
+                    '0' if self.dry_run
+                    else f"{result['buy_fee']}+{result['sell_fee']}={result['buy_fee'] + result['sell_fee']:.4f}"
+                )
+                self.send_webhook(self.ALERT_TMPL.format(
+                    mode='[模拟] ' if self.dry_run else '',
+                    symbol=self.symbol,
+                    buy_ex=buy_ex,
+                    buy_price=result['buy_price'],
+                    sell_ex=sell_ex,
+                    sell_price=result['sell_price'],
+                    spread=(result['sell_price'] - result['buy_price']) / result['buy_price'] * 100.0,
+                    profit=result['profit'],
+                    quote_ccy=self.quote_ccy,
+                    fee_detail=fee_detail,
+                    remaining=self.max_trades - self.trade_count,
+                ))
+
+                if self.trade_count >= self.max_trades:
+                    await self.stop("🎯 已达最大交易次数")
 
         except Exception as e:
             error_msg = [
@@ -222,37 +459,51 @@ class MultiExchangeArbitrageBot(SinglePairMonitor):
                 f"错误: {str(e)}",
                 f"剩余次数: {self.max_trades - self.trade_count}"
             ]
-            self.send_webhook("\n".join(error_msg))
-            print(f"Error: {str(e)}")
+            # 致命告警同步发出，确保退出前已送达
+            await self._post_webhook("\n".join(error_msg))
+            logger.error(f"Error: {str(e)}")
             # 直接退出，余额不足，断网问题，账号被限制
             exit(1)
 
     async def stop(self, reason="正常停止"):
         self.is_running = False
-        print(f"🛑 停止原因: {reason}")
+        logger.info(f"🛑 停止原因: {reason}")
         self.send_webhook(f"⚠️ 机器人停止: {reason}")
         self.print_summary()
 
-        # 取消task
-        for task in asyncio.all_tasks():
+        # 只取消自己登记的行情/余额/保活任务；asyncio.all_tasks() 广播会把
+        # 在途的 webhook POST 一并掐断，半截 HTTP 请求留在线上
+        for task in self._ws_tasks:
             if task is not asyncio.current_task():
                 task.cancel()
 
+    async def aclose(self):
+        """退出前的收尾：等在途 webhook 发完再关 HTTP 会话和交易所连接。
+        asyncio.run 收尾时会取消所有遗留任务，不在这里等，停机/汇总
+        告警就可能半途被掐掉"""
+        pending = [t for t in self._webhook_tasks if not t.done()]
+        if pending:
+            await asyncio.wait(pending, timeout=5)
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+        for ex_name, exchange in self.exchange_instances.items():
+            try:
+                await exchange.close()
+            except Exception as e:
+                logger.warning(f"{ex_name} 连接关闭失败: {str(e)}")
+
     def print_summary(self, is_error=False):
-        summary = [
-            "\n" + "="*40,
-            f"{'⚠️ 异常终止' if is_error else '🔚 正常退出'}",
-            f"模式: {'模拟交易' if self.dry_run else '真实交易'}",
-            f"交易对: {self.symbol}",
-            f"交易所: {', '.join(self.exchanges)}",
-            f"利差百分比阈值: {self.threshold}%",
-            f"运行时长: {datetime.now() - self.start_time}",
-            f"总交易次数: {self.trade_count}",
-            f"总利润: {self.total_profit:.4f}",
-            "="*40
-        ]
-        report = "\n".join(summary)
-        print(report)
+        report = self.SUMMARY_TMPL.format(
+            title='⚠️ 异常终止' if is_error else '🔚 正常退出',
+            mode='模拟交易' if self.dry_run else '真实交易',
+            symbol=self.symbol,
+            exchanges=', '.join(self.exchanges),
+            threshold=self.threshold,
+            duration=datetime.now() - self.start_time,
+            trade_count=self.trade_count,
+            total_profit=self.total_profit,
+        )
+        logger.info(report)
         self.send_webhook(report)
 
 async def main():
@@ -267,9 +518,12 @@ async def main():
     parser.add_argument('--threshold', type=float, default=0.3, help='价差阈值(百分比)')
     parser.add_argument('--limit', type=float, default=1, help='单次交易限额')
     parser.add_argument('--max-trades', type=int, default=1, help='最大交易次数')
+    parser.add_argument('--debug', action='store_true',
+                       help='输出DEBUG日志（含每个tick的实时价差状态）')
     parser.set_defaults(dry_run=True)
     args = parser.parse_args()
 
+    listener = setup_logging(debug=args.debug)
     try:
         with open(args.config) as f:
             config = yaml.safe_load(f)
@@ -285,21 +539,35 @@ async def main():
         )
         
         # 先同步初始化
+        await asyncio.gather(*(ensure_markets(ex) for ex in bot.exchange_instances.values()))
         await bot.show_initial_balances()
         
-        # 启动交易所连接
-        tasks = [bot.connect_exchange(ex) for ex in args.exchanges]
-        await asyncio.gather(*tasks)
+        # 启动交易所行情推送流；实盘另起账户余额推送流（模拟交易不需要认证流）
+        # TaskGroup 的结构化取消保证任何一个流致命失败时其余流一并收敛
+        async with asyncio.TaskGroup() as tg:
+            for ex in args.exchanges:
+                bot._ws_tasks.append(tg.create_task(bot.watch_prices(ex)))
+            if not args.dry_run:
+                for ex in args.exchanges:
+                    bot._ws_tasks.append(tg.create_task(bot.watch_balances(ex)))
+                # 实盘保持下单连接热态，下单时刻只付一个请求往返
+                bot._ws_tasks.append(tg.create_task(bot.keep_connections_warm()))
     except asyncio.exceptions.CancelledError:
         print("\n安全退出")
     except Exception as e:
         print(f"❌ 致命错误: {str(e)}")
         if 'bot' in locals():
             await bot.stop(f"异常终止: {str(e)}")
-            
+    finally:
+        if 'bot' in locals():
+            await bot.aclose()
+        listener.stop()  # 退出前把队列里攒着的日志冲刷到 stdout
+
 
 if __name__ == "__main__":
     try:
+        if uvloop is not None:
+            uvloop.install()
         asyncio.run(main())
     except KeyboardInterrupt:
         print("\n安全退出")
\ No newline at end of file
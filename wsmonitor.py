@@ -1,73 +1,148 @@
 import argparse
-import json
 import asyncio
-from datetime import datetime
-from collections import defaultdict
+import copy
+
+try:
+    import orjson
+except ImportError:
+    # 未装 orjson 时退回标准库，接口对齐（dumps 返回 bytes），监控照常可用
+    import json as _stdlib_json
+
+    class orjson:
+        loads = staticmethod(_stdlib_json.loads)
+
+        @staticmethod
+        def dumps(obj):
+            return _stdlib_json.dumps(obj).encode()
 import websockets
-import requests
+import aiohttp
 import time
 
+try:
+    # libuv 事件循环的调度开销比默认 selector 循环低数倍，装了就用
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # WebSocket配置（更新支持更多交易所）
 EXCHANGE_WS_CONFIG = {
     'binance': {
         'url': 'wss://stream.binance.com:9443/ws/{symbol}@trade',
-        'price_key': 'p',
-        'symbol_format': lambda s: s.replace('/', '').lower()
+        'symbol_format': lambda s: s.replace('/', '').lower(),
+        # extract：从解析后的帧里取价格，非行情帧返回 None。
+        # 每帧一次间接调用替代原来 connect_exchange 里的整棵 if/elif 分支树
+        'extract': lambda d: d.get('p')
     },
     'okx': {
         'url': 'wss://exchainws.okex.org:8443',
-        'price_key': 'lastPx',
         'subscribe_msg': {
             "op": "subscribe",
             "args": [{
                 "channel": "tickers",  # 注意频道名是 "tickers" 而非 "ticker"
                 "instType": "SPOT",    # 明确产品类型（现货）
-                "instId": "{symbol}"   # 交易对名称用短横线分隔
+                "instId": None         # 连接时填入格式化后的交易对（短横线分隔）
             }]
         },
-        'symbol_format': lambda s: s.replace('/', '-')
+        'symbol_format': lambda s: s.replace('/', '-'),
+        'extract': lambda d: d['data'][0]['lastPx'] if d.get('data') else None
     },
     'bitget': {
         'url': 'wss://ws.bitget.com/v2/ws/public',
-        'price_key': 'markPrice',
         'subscribe_msg': {
             "op": "subscribe",
             "args": [{
                 "instType": "USDT-FUTURES",
                 "channel": "ticker",
-                "instId": "{symbol}"
+                "instId": None  # 连接时填入格式化后的交易对
             }]
         },
-        'symbol_format': lambda s: s.replace('/', '')
+        'symbol_format': lambda s: s.replace('/', ''),
+        'extract': lambda d: (d['data'][0].get('markPrice')
+                              if d.get('action') in ('snapshot', 'update') and d.get('data')
+                              else None)
     },
     'htx': {
         'url': 'wss://api-aws.huobi.pro/ws',
-        'price_key': 'price',
-        'symbol_format': lambda s: s.replace('/', '').lower() + '.trade.detail'
+        'symbol_format': lambda s: s.replace('/', '').lower() + '.trade.detail',
+        'extract': lambda d: d['tick']['data'][0]['price'] if 'tick' in d else None
     }
 }
 
 # wsmonitor.py 部分关键修改
 
 class SinglePairMonitor:
-    def __init__(self, symbol: str, exchanges, threshold, webhook_url):
+    def __init__(self, symbol: str, exchanges, threshold, webhook_url, verbose=False):
         self.symbol = symbol
         self.exchanges = exchanges
         self.threshold = threshold
         self.webhook_url = webhook_url
         self.is_running = True
+        # 逐 tick 状态打印只在排查时打开，常态运行不为每帧付格式化和 stdout 开销
+        self._verbose = verbose
         
-        # 价格存储结构：{exchange: price}
-        self.prices = defaultdict(lambda: None)
-        self.lock = asyncio.Lock()
-        self.last_alert_time = defaultdict(lambda: 0)
+        # 价格存储结构：{exchange: price}，交易所集合构造时已知，
+        # 预填普通 dict，miss 时不用再调 defaultdict 的工厂 lambda
+        self.prices = {ex: None for ex in exchanges}
+        # 单个监控进程只有一个交易对，上次警报时刻用一个浮点属性即可
+        self._last_alert = 0.0
+        # 持有在途警报任务的引用：裸的 create_task 结果可能中途被垃圾回收
+        self._alert_tasks = set()
+        # 接收与计算解耦：socket 协程只投递 (交易所, 价格)，满了就丢——
+        # 价差只关心最新价，过期 tick 丢掉是正确行为
+        self._q = asyncio.Queue(maxsize=256)
+        # aiohttp 会话首次警报时在事件循环内创建，之后复用 keep-alive 长连接，
+        # 后续警报省掉每次的 TCP/TLS 握手，也不再为每次发送起线程
+        self._session = None
+        # 时间戳秒级部分的缓存：同一秒内的 tick 复用格式化结果
+        self._ts_sec = 0
+        self._ts_str = ''
+        # 增量维护的极值：常态下每 tick O(1)，只有旧极值被改动时才整表重扫
+        self._min_ex = None
+        self._max_ex = None
+        self._min_val = float('inf')
+        self._max_val = float('-inf')
+        self._valid_count = 0
+
+    async def consume_updates(self):
+        """队列消费端：统一串行处理各交易所投递的价格更新，
+        socket 协程的下一次 recv 不用等价差计算完成"""
+        while self.is_running:
+            exchange, price = await self._q.get()
+            await self.handle_price_update(exchange, price)
+
+    def _rescan_extrema(self):
+        """整表重扫最小/最大价，仅在旧极值所在交易所的价格朝反方向移动时调用"""
+        self._min_val = float('inf')
+        self._max_val = float('-inf')
+        for ex, p in self.prices.items():
+            if p is None:
+                continue
+            if p < self._min_val:
+                self._min_val = p
+                self._min_ex = ex
+            if p > self._max_val:
+                self._max_val = p
+                self._max_ex = ex
+
+    def _timestamp(self):
+        """状态行时间戳：strftime 结果按秒缓存，每个 tick 只需拼接毫秒部分，
+        避免逐 tick 构造 datetime 对象并完整格式化"""
+        now = time.time()
+        sec = int(now)
+        if sec != self._ts_sec:
+            self._ts_sec = sec
+            self._ts_str = time.strftime('%H:%M:%S', time.localtime(sec))
+        return f"{self._ts_str}.{int((now - sec) * 1000):03d}"
 
     async def send_alert(self, spread, prices):
         """发送价差警报（带频率限制）"""
         now = time.time()
-        if now - self.last_alert_time[self.symbol] < 60:  # 1分钟间隔
+        if now - self._last_alert < 60:  # 1分钟间隔
             return
-            
+        # 先占住静默窗口再发送：POST 往返期间到达的超阈值 tick 不会再
+        # 通过节流检查重复投递
+        self._last_alert = now
+
         alert_msg = (
             f"🚨 价差警报！{self.symbol}\n"
             f"当前价差: {spread:.2f}% (阈值: {self.threshold}%)\n"
@@ -75,46 +150,70 @@ class SinglePairMonitor:
             "\n".join([f"{ex.upper()}: {price}" for ex, price in prices.items()])
         )
         try:
-            await asyncio.to_thread(
-                requests.post,
+            if self._session is None:
+                self._session = aiohttp.ClientSession(
+                    timeout=aiohttp.ClientTimeout(total=5),
+                    connector=aiohttp.TCPConnector(limit=4, ttl_dns_cache=300),
+                )
+            # data= 传 orjson 序列化结果，绕过 aiohttp 内部的 stdlib json 编码
+            async with self._session.post(
                 self.webhook_url,
-                json={"msgtype": "text", "text": {"content": alert_msg}}
-            )
-            self.last_alert_time[self.symbol] = now
+                data=orjson.dumps({"msgtype": "text", "text": {"content": alert_msg}}),
+                headers={'Content-Type': 'application/json'}
+            ) as resp:
+                await resp.read()
             print(f"警报已发送：{self.symbol}")
         except Exception as e:
+            # 发送失败就释放静默窗口，下一个超阈值 tick 可以立即重试
+            self._last_alert = 0.0
             print(f"警报发送失败：{str(e)}")
 
     async def handle_price_update(self, exchange, price):
         """处理价格更新并立即计算价差"""
 
-        # 数据驱动
-        print(f"更新价格: {exchange} - {price}")
-        async with self.lock:
-            # 更新价格
-            self.prices[exchange] = float(price)
-            
-            # 过滤无效价格
-            valid_prices = {k: v for k, v in self.prices.items() if v is not None}
-            if len(valid_prices) < 2:
-                return
+        # 事件循环单线程，从更新价格到判断价差之间没有 await、不会被抢占，
+        # 不需要锁；不同交易所的 tick 也不再彼此排队
+        price = float(price)
+        if self.prices[exchange] is None:
+            self._valid_count += 1
+        self.prices[exchange] = price
+
+        # 增量更新极值：旧极值被抬高/压低时才整表重扫，其余情况 O(1)
+        if ((exchange == self._min_ex and price > self._min_val)
+                or (exchange == self._max_ex and price < self._max_val)):
+            self._rescan_extrema()
+        else:
+            if price < self._min_val:
+                self._min_val = price
+                self._min_ex = exchange
+            if price > self._max_val:
+                self._max_val = price
+                self._max_ex = exchange
+
+        if self._valid_count < 2:
+            return
+
+        # 计算价差
+        min_price = self._min_val
+        max_price = self._max_val
+        spread = ((max_price - min_price) / min_price) * 100
 
-            # 计算价差
-            min_price = min(valid_prices.values())
-            max_price = max(valid_prices.values())
-            spread = ((max_price - min_price) / min_price) * 100
+        # 触发警报：发送作为后台任务投递，本协程立即返回继续消费行情。
+        # 频率限制在这里先短路一次——持续波动期多数触发都落在静默窗口内，
+        # 省掉价格快照和协程创建；send_alert 内部保留同样的检查兜底
+        if spread >= self.threshold and time.time() - self._last_alert >= 60:
+            valid_prices = {k: v for k, v in self.prices.items() if v is not None}
+            task = asyncio.create_task(self.send_alert(spread, valid_prices))
+            self._alert_tasks.add(task)
+            task.add_done_callback(self._alert_tasks.discard)
 
-            # 打印实时状态
+        if self._verbose:
             status = [
-                f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] {self.symbol}",
-                *[f"{ex.upper()}: {price:.4f}" for ex, price in valid_prices.items()],
+                f"[{self._timestamp()}] {self.symbol}",
+                *[f"{ex.upper()}: {p:.4f}" for ex, p in self.prices.items() if p is not None],
                 f"价差: {spread:.4f}%"
             ]
             print("\n".join(status) + "\n" + "-"*40)
-
-            # 触发警报
-            if spread >= self.threshold:
-                await self.send_alert(spread, valid_prices)
     async def connect_exchange(self, exchange):
         """连接交易所WebSocket"""
         config = EXCHANGE_WS_CONFIG.get(exchange)
@@ -123,86 +222,107 @@ class SinglePairMonitor:
             return
 
         formatted_symbol = config['symbol_format'](self.symbol)
-        
+        extract = config['extract']
+        is_htx = exchange == 'htx'
+        url = (config['url'].format(symbol=formatted_symbol)
+               if '{symbol}' in config['url'] else config['url'])
+
+        # 订阅消息对 (交易所, 交易对) 恒定，提前序列化好；重连循环里只剩
+        # send，交易所故障恢复时重连路径不再重复做 JSON 序列化和字符串替换
+        if is_htx:
+            # HTX 不走通用 subscribe_msg，订阅格式是 sub/id
+            sub_msg = orjson.dumps({
+                "sub": f"market.{formatted_symbol}",
+                "id": "price_monitor"
+            }).decode()
+        elif 'subscribe_msg' in config:
+            # 在模板 dict 的副本上直接填 instId 再序列化，不走“序列化后
+            # 字符串替换”——交易对含特殊字符时不会破坏 JSON 结构
+            msg = copy.deepcopy(config['subscribe_msg'])
+            msg['args'][0]['instId'] = formatted_symbol
+            sub_msg = orjson.dumps(msg).decode()
+        else:
+            sub_msg = None
+
+        # 行情帧的字节探针：订阅确认/频道事件等控制帧在 JSON 解析之前就被
+        # 拦下，与 HTX 心跳快路径同一思路。探针按已知的控制帧前缀做排除，
+        # 不去匹配行情帧内容——行情帧的键位置随 instId 长度浮动，按内容匹配
+        # 会把长交易对的行情整流误杀；误放行的帧仍会被完整解析后由
+        # extract 判为 None，不影响正确性
+        if exchange == 'bitget':
+            # Bitget 行情推送固定以 {"action": 开头，控制帧以 {"event": 开头
+            probe = lambda b: b.startswith(b'{"action":')
+        elif exchange == 'okx':
+            # OKX 的订阅确认/错误等控制帧固定以 {"event": 开头
+            probe = lambda b: not b.startswith(b'{"event":')
+        else:
+            probe = None
+
+        backoff = 1  # 指数退避：交易所故障时不以固定频率撞墙，恢复后第一时间重连
         try:
             while self.is_running:
+                connected_at = time.monotonic()
                 try:
-                    if exchange == 'htx':
-                        # HTX需要特殊处理订阅消息
-                        async with websockets.connect(config['url']) as ws:
-                            sub_msg = json.dumps({
-                                "sub": f"market.{formatted_symbol}",
-                                "id": "price_monitor"
-                            })
+                    # compression=None 关掉 per-message-deflate 协商：小行情帧压缩
+                    # 收益趋近于零，却要为每帧付一次 zlib 解压；max_size 限制单帧
+                    # 上限，异常超大帧直接断开重连而不是任由分配内存
+                    async with websockets.connect(
+                        url,
+                        compression=None,
+                        max_size=262144,
+                        ping_interval=20,
+                        ping_timeout=20,
+                    ) as ws:
+                        if sub_msg is not None:
                             await ws.send(sub_msg)
-                            
-                            async for msg in ws:
-                                data = json.loads(msg)
-                                if 'ping' in data:
-                                    # 保持连接心跳
-                                    pong_msg = json.dumps({"pong": data['ping']})
-                                    await ws.send(pong_msg)
-                                elif 'tick' in data:
-                                    price = data['tick']['data'][0]['price']
-                                    await self.handle_price_update(exchange, price)
-                    
-                    elif exchange == 'bitget':
-                        async with websockets.connect(config['url']) as ws:
-                            sub_msg = json.dumps(
-                                config['subscribe_msg']
-                            ).replace("{symbol}", formatted_symbol)
-                            await ws.send(sub_msg)
-                            
-                            async for msg in ws:
-                                try:
-                                    data = json.loads(msg)
-                                    if data.get('action') not in ['snapshot', 'update']:
-                                        continue
-                                    
-                                    trades = data.get('data', [])
-                                    if not isinstance(trades, list) or len(trades) == 0:
-                                        continue
-                                    
-                                    latest_trade = trades[0]
-                                    price = latest_trade.get(config['price_key'])
-                                    if price is None:
-                                        print(f"Bitget 价格解析失败: {msg}")
-                                        continue
-                                    
-                                    await self.handle_price_update(exchange, float(price))
-                                    
-                                except Exception as e:
-                                    print(f"Bitget 消息处理异常: {str(e)}")
+
+                        # 上一个投递过的原始价。盘口平稳时交易所会连续推相同
+                        # 价位的成交，原样比较一次就能跳过后面的全部处理
+                        last_price = None
+
+                        async for msg in ws:
+                            raw = msg if isinstance(msg, bytes) else msg.encode()
+
+                            # HTX 心跳帧是固定形状 {"ping":<ts>}，按字节前缀直接
+                            # 截出时间戳拼 pong 回包，最高频的控制帧跳过 JSON 解析
+                            if is_htx and raw.startswith(b'{"ping":'):
+                                # decode 成文本帧发送：bytes 会走二进制帧，交易所未必接受
+                                await ws.send((b'{"pong":' + raw[8:-1] + b'}').decode())
+                                continue
+
+                            if probe is not None and not probe(raw):
+                                continue
+                            msg = raw
+
+                            try:
+                                data = orjson.loads(msg)
+                                if is_htx and 'ping' in data:
+                                    # 兜底：个别帧带空白等非标准排版时仍能回心跳
+                                    await ws.send(orjson.dumps({"pong": data['ping']}).decode())
+                                    continue
+
+                                price = extract(data)
+                                if price is None or price == last_price:
                                     continue
-                    
-                    else:  # 处理其他交易所
-                        url = config['url'].format(symbol=formatted_symbol)
-                        if exchange == 'okx':
-                            url = config['url']
-                        
-                        async with websockets.connect(url) as ws:
-                            if 'subscribe_msg' in config:
-                                sub_msg = json.dumps(
-                                    config['subscribe_msg']
-                                ).replace("{symbol}", formatted_symbol)
-                                await ws.send(sub_msg)
-                            
-                            async for msg in ws:
+                                last_price = price
+
                                 try:
-                                    data = json.loads(msg)
-                                    if exchange == 'binance':
-                                        price = float(data.get(config['price_key']))
-                                    else:
-                                        continue
-                                    
-                                    await self.handle_price_update(exchange, price)
-                                    
-                                except Exception as e:
-                                    print(f"{exchange} 消息处理异常: {str(e)}")
-                                    continue 
+                                    # 原始值入队，float 解析推迟到消费端：接收循环
+                                    # 只做前缀判断、extract 和去重这些廉价操作
+                                    self._q.put_nowait((exchange, price))
+                                except asyncio.QueueFull:
+                                    pass  # 消费端在忙，丢弃过期tick
+
+                            except Exception as e:
+                                print(f"{exchange} 消息处理异常: {str(e)}")
+                                continue
                 except Exception as e:
-                    print(f"{exchange}连接错误：{str(e)}，5秒后重连...")
-                    await asyncio.sleep(5)
+                    # 连接存活超过一分钟说明上次故障已恢复，退避时间归位
+                    if time.monotonic() - connected_at > 60:
+                        backoff = 1
+                    print(f"{exchange}连接错误：{str(e)}，{backoff}秒后重连...")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 30)
         except asyncio.exceptions.CancelledError:
             print("ws 连接已取消")
         except asyncio.CancelledError:
@@ -220,7 +340,9 @@ async def main():
                        help="触发警报的价差百分比 (默认: 0.1)")
     parser.add_argument('--webhook', required=True,
                        help="报警通知的Webhook URL")
-    
+    parser.add_argument('--verbose', action='store_true',
+                       help="打印每个tick的实时价格状态（排查用，默认关闭）")
+
     args = parser.parse_args()
 
     print("\n" + "="*40)
@@ -234,15 +356,18 @@ async def main():
         symbol=args.symbol,
         exchanges=args.exchanges,
         threshold=args.threshold,
-        webhook_url=args.webhook
+        webhook_url=args.webhook,
+        verbose=args.verbose
     )
 
-    # 启动所有交易所连接
+    # 启动所有交易所连接和统一的价格消费协程
     tasks = [monitor.connect_exchange(ex) for ex in args.exchanges]
-    await asyncio.gather(*tasks)
+    await asyncio.gather(monitor.consume_updates(), *tasks)
 
 if __name__ == "__main__":
     try:
+        if uvloop is not None:
+            uvloop.install()
         asyncio.run(main())
     except KeyboardInterrupt:
         print("\n监控已停止")
\ No newline at end of file